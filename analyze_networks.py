@@ -2,13 +2,20 @@
 
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-import matplotlib.pyplot as plt
 import networkx as nx
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from utils.metrics import compute_metric
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from utils.metrics import NODE_METRICS, compute_metric, node_values
 
 
 def read_node_link_json(path):
@@ -17,89 +24,182 @@ def read_node_link_json(path):
     node-link data format and return the corresponding
     NetworkX graph.
     """
-    json_data = json.load(open(os.path.join(path, "G.json")))
+    with open(os.path.join(path, "G.json"), 'rb') as json_file:
+        if orjson is not None:
+            json_data = orjson.loads(json_file.read())
+        else:
+            json_data = json.load(json_file)
+
     return nx.node_link_graph(json_data)
 
 
-def global_metrics(G, metrics=None):
+def node_metric(G, metric):
+    """
+    Return the {node: value} dictionary of `metric` for the network G.
+    The metrics in `NODE_METRICS` are computed with a single call over 
+    the whole network and cached, the others node by node.
+    """
+    if metric in NODE_METRICS:
+        return node_values(G, metric)
+
+    return {node: compute_metric(G, metric, u=node) for node in G.nodes}
+
+
+def compute_all_metrics(G, metrics):
     """
     Compute the global metrics of the network G and return 
     them as a list.
     """
-    result = []
-    for metric in metrics:
-        result.append(compute_metric(G, metric))
-    
-    return result
+    return [compute_metric(G, metric) for metric in metrics]
+
+
+# Figure and axes reused by `plot_distribution` for all the plots.
+_FIG, _AX = None, None
 
 
 def plot_distribution(df, column, outfile=None, label_ticks=25):
-    unique_values = df[column].unique()
-
-    """Plot the histogram of the specified column."""
-    plt.figure(figsize=(10, 6))
-    df[column].value_counts().sort_index().plot(kind='bar', color='skyblue')
-    plt.title(f'Distribution of {column}')
-    plt.xlabel(column)
-    plt.ylabel('Frequency')
-
-    # Set x-axis ticks and labels for better readability.
-    if label_ticks is not None and len(unique_values) > label_ticks:
-        # Display labels for a subset of ticks
-        tick_positions = range(0, len(unique_values), len(unique_values) // label_ticks)
-        tick_labels = [str(unique_values[i]) for i in tick_positions]
-        plt.xticks(tick_positions, tick_labels)
-
-    if outfile:
-        plt.savefig(outfile)
+    """
+    Plot the histogram of the specified column and save it to `outfile`.
+    If `outfile` is None, return the figure instead. The figure is shared
+    by all the plots, so it is cleared by the next call.
+    """
+    global _FIG, _AX
+    if _FIG is None:
+        # Load matplotlib only when plotting, so that importing this 
+        # module (e.g. in the worker processes) does not pay for it.
+        import matplotlib.pyplot as plt
+        _FIG, _AX = plt.subplots(figsize=(10, 6))
+    _AX.cla()
+
+    values = df[column]
+    if pd.api.types.is_integer_dtype(values) and values.min() >= 0:
+        # Count the non-negative integers (e.g. degrees) directly. The bar 
+        # at position i is the frequency of the value i, so the x-axis is
+        # already numeric and readable.
+        counts = np.bincount(values.to_numpy())
+        _AX.bar(np.arange(len(counts)), counts, color='skyblue')
     else:
-        plt.show()
+        counts = values.value_counts().sort_index()
+        counts.plot(kind='bar', color='skyblue', ax=_AX)
+
+        # Set x-axis ticks and labels for better readability.
+        if label_ticks is not None and len(counts) > label_ticks:
+            # Display labels for a subset of ticks
+            tick_positions = range(0, len(counts), len(counts) // label_ticks)
+            tick_labels = [str(counts.index[i]) for i in tick_positions]
+            _AX.set_xticks(tick_positions, tick_labels)
+
+    _AX.set_title(f'Distribution of {column}')
+    _AX.set_xlabel(column)
+    _AX.set_ylabel('Frequency')
 
+    if outfile is None:
+        return _FIG
 
-def analyze_networks(data_dir, outdir, compute_global=True, compute_local=True):
+    _FIG.savefig(outfile)
+
+
+def _process_net(path, global_metrics=None, local_metrics=None):
+    """
+    Load the network stored in `path` and compute its metrics.
+    Return the list of global metrics and the DataFrame of local metrics,
+    or None for the ones that are not requested.
+    """
+    # Load the network only once for both global and local metrics.
+    G = read_node_link_json(path)
+
+    # GLOBAL METRICS
+    global_row = None
+    if global_metrics is not None:
+        global_row = compute_all_metrics(G, global_metrics)
+
+    # LOCAL METRICS
+    local_df = None
+    if local_metrics is not None:
+        local_result = {
+            metric: node_metric(G, metric)
+            for metric in local_metrics
+        }
+        local_df = pd.DataFrame(local_result, columns=local_metrics)
+
+    return global_row, local_df
+
+
+def analyze_networks(data_dir, outdir, compute_global=True, compute_local=True, max_workers=None):
     """
     Analyze global and local metrics of the network in `path`.
     The network must be provided in node-link data format.
     The results of the analysis will be stored in `outdir`.
+    The networks are analyzed in parallel using up to `max_workers`
+    processes (by default, the number of CPUs).
     """
 
     # Get all networks.
     networks = [net for net in os.listdir(data_dir)]
 
-    # GLOBAL METRICS
+    global_metrics = [
+        "num_nodes",
+        "num_edges",
+        "avg_degree",
+        # "longest_shortest_path",
+        "avg_shortest_path",
+        "radius",
+        "diameter",
+        "node_connectivity",
+        "edge_connectivity",
+        "avg_closeness_centrality",
+        "avg_betweenness_centrality",
+        "avg_degree_centrality",
+        # "avg_pagerank",
+        "avg_eigenvector_centrality",
+        "avg_clustering",
+        "assortativity"
+    ]
+
+    local_metrics = [
+        "degree",
+        # "edge_assortativity",
+        # "eccentricity",
+        # "closeness_centrality",
+        # "betweenness_centrality",
+        # "degree_centrality",
+        # "eigenvector_centrality",
+        # "clustering"
+    ]
+
+    global_result = {}
+
+    if outdir is not None:
+        os.makedirs(outdir, exist_ok=True)
+
+    # Compute the metrics of the independent networks in parallel.
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            _process_net,
+            [f"{data_dir}/{net}" for net in networks],
+            repeat(global_metrics if compute_global else None),
+            repeat(local_metrics if compute_local else None)
+        )
+
+        for net, (global_row, df) in tqdm(zip(networks, results), total=len(networks), desc="Computing metrics"):
+            if compute_global:
+                global_result[net] = global_row
+
+            if compute_local:
+                # Export.
+                if outdir is not None:
+                    df.to_csv(f"{outdir}/local_metrics_{net}.csv")
+
+                for metric in local_metrics:
+                    if net == "ppi":
+                        label_ticks = 25
+                    else:
+                        label_ticks = None
+                        
+                    plot_distribution(df, column=metric, label_ticks=label_ticks, outfile=f'plots/{net}_{metric}_distribution_plot.png')
+
+    # Export.
     if compute_global:
-        global_metrics = [
-            "num_nodes",
-            "num_edges",
-            "avg_degree",
-            # "longest_shortest_path",
-            "avg_shortest_path",
-            "radius",
-            "diameter",
-            "node_connectivity",
-            "edge_connectivity",
-            "avg_closeness_centrality",
-            "avg_betweenness_centrality",
-            "avg_degree_centrality",
-            # "avg_pagerank",
-            "avg_eigenvector_centrality",
-            "avg_clustering",
-            "assortativity"
-        ]
-
-        global_result = {}
-
-        for net in tqdm(networks, desc="Computing global metrics"):
-            G = read_node_link_json(f"{data_dir}/{net}")
-            global_result[net] = []
-
-            for metric in global_metrics:
-                global_result[net].append(compute_metric(G, metric))
-
-        # Export.
-        if not os.path.exists(f"{outdir}"):
-            os.makedirs(f"{outdir}") 
-        
         df = pd.DataFrame.from_dict(
             global_result, 
             orient='index',
@@ -108,51 +208,13 @@ def analyze_networks(data_dir, outdir, compute_global=True, compute_local=True):
 
         if outdir is not None:
             df.to_csv(f"{outdir}/global_metrics.csv")
-        
-    # LOCAL METRICS
-    if compute_local:
-        local_metrics = [
-            "degree",
-            # "edge_assortativity",
-            # "eccentricity",
-            # "closeness_centrality",
-            # "betweenness_centrality",
-            # "degree_centrality",
-            # "eigenvector_centrality",
-            # "clustering"
-        ]
-
-        for net in tqdm(networks, desc="Computing local metrics"):
-            G = read_node_link_json(f"{data_dir}/{net}")
-            local_result = {}
-            for node in G.nodes:
-                local_result[node] = []
-                for metric in local_metrics:
-                    local_result[node].append(compute_metric(G, metric, u=node))
-                
-            # Export.
-            if not os.path.exists(f"{outdir}"):
-                os.makedirs(f"{outdir}") 
-        
-            df = pd.DataFrame.from_dict(
-                local_result, 
-                orient='index',
-                columns=local_metrics
-            )
-
-            if outdir is not None:
-                df.to_csv(f"{outdir}/local_metrics_{net}.csv")
-
-            for metric in local_metrics:
-                if net == "ppi":
-                    label_ticks = 25
-                else:
-                    label_ticks = None
-                    
-                plot_distribution(df, column=metric, label_ticks=label_ticks, outfile=f'plots/{net}_{metric}_distribution_plot.png')
 
 
 if __name__ == '__main__':
+    # Plots are only saved to file: use the non-interactive backend.
+    import matplotlib
+    matplotlib.use('Agg')
+
     # Set path names.
     DATA_DIR = "networks/"
     OUTDIR = "results/"
@@ -14,15 +14,11 @@ def read_csv_matrix(filepath):
     return df
 
 
-def get_id2idx(dict):
+def get_id2idx(graph_data):
     """
     Construct the dictionary mapping the node names (IDs) to the node indices.
     """
-    id2idx = {}
-    for idx, node in enumerate(dict['nodes']):
-        id2idx[node['id']] = idx
-        
-    return id2idx
+    return {node['id']: idx for idx, node in enumerate(graph_data['nodes'])}
 
 
 def generate_network(path, outdir):
@@ -59,8 +55,7 @@ def generate_network(path, outdir):
     id2idx = get_id2idx(json_data)
 
     # Export.
-    if not os.path.exists(f"{outdir}/{filename}"):
-        os.makedirs(f"{outdir}/{filename}") 
+    os.makedirs(f"{outdir}/{filename}", exist_ok=True)
 
     json_filepath = f"{outdir}/{filename}/G.json"
     id2idx_filepath = f"{outdir}/{filename}/id2idx.json"
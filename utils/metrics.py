@@ -1,55 +1,279 @@
 """Set of utilities to compute global and local metrics of a network."""
 
+import weakref
+
 import networkx as nx
 import numpy as np
+import scipy.sparse.csgraph
+import scipy.sparse.linalg
 
+try:
+    import igraph as ig
+except ImportError:
+    ig = None
 
-def compute_metric(G, metric, u=None):
-    if metric == "num_nodes":
-        return G.number_of_nodes()
-    elif metric == "num_edges":
-        return G.number_of_edges()
-    elif metric == "avg_degree":
-        return np.mean([d for _, d in G.degree()])
-    elif metric == "longest_shortest_path":
-        return max(list(nx.shortest_path_length(G)))
-    elif metric == "avg_shortest_path":
+
+def eigenvector_centrality(G):
+    """
+    Compute the eigenvector centrality of the nodes of G using the
+    sparse eigensolver of SciPy (ARPACK). Fall back to the power
+    iteration of NetworkX if ARPACK fails, and for the graphs ARPACK
+    cannot handle (2 nodes or less, no edges) or that NetworkX does not
+    support (multigraphs).
+    """
+    if len(G) <= 2 or G.number_of_edges() == 0 or G.is_multigraph():
+        return nx.eigenvector_centrality(G)
+
+    try:
+        values = nx.eigenvector_centrality_numpy(G)
+    except scipy.sparse.linalg.ArpackError:
+        return nx.eigenvector_centrality(G)
+
+    # The centralities are non-negative: drop the sign of the -0.0 and
+    # round-off entries of the nodes outside the main component.
+    return {node: abs(value) for node, value in values.items()}
+
+
+def clustering(G):
+    """
+    Compute the clustering coefficient of the nodes of G, counting the
+    triangles with a sparse matrix product. As `nx.clustering`, the 
+    weights and the self-loops are ignored.
+    """
+    if G.is_directed() or G.is_multigraph():
+        return nx.clustering(G)
+
+    A = nx.to_scipy_sparse_array(G, weight=None, format="csr")
+    A = A - scipy.sparse.diags_array(A.diagonal(), dtype=A.dtype)
+    A.eliminate_zeros()
+
+    # Twice the number of triangles through each node, i.e. diag(A^3).
+    triangles = (A @ A).multiply(A).sum(axis=1)
+    degrees = A.sum(axis=1)
+    pairs = degrees * (degrees - 1)
+
+    values = np.zeros(len(degrees))
+    np.divide(triangles, pairs, out=values, where=pairs > 0)
+    return dict(zip(G, values.tolist()))
+
+
+# Cached results of the metrics, by graph and metric name.
+_cache = weakref.WeakKeyDictionary()
+
+
+# Largest graph whose dense matrix of shortest path lengths is computed 
+# and cached (5000^2 float64 values are 200 MB). Larger graphs use the 
+# NetworkX BFS, which only needs O(n) memory.
+MAX_DENSE_NODES = 5000
+
+
+def shortest_path_lengths(G):
+    """
+    Return the matrix of the shortest path lengths (number of edges) 
+    between all the pairs of nodes of G, in the order of G.nodes.
+    All the pairs are computed at once by the compiled BFS of SciPy
+    and only once per graph.
+    """
+    graph_cache = _cache.setdefault(G, {})
+    if "shortest_path_lengths" not in graph_cache:
+        A = nx.to_scipy_sparse_array(G, weight=None, format="csr")
+        graph_cache["shortest_path_lengths"] = scipy.sparse.csgraph.shortest_path(
+            A, directed=G.is_directed(), unweighted=True
+        )
+
+    return graph_cache["shortest_path_lengths"]
+
+
+def eccentricities(G):
+    """Return the array of the eccentricities of the nodes of G."""
+    if G.number_of_nodes() > MAX_DENSE_NODES:
+        return np.array(list(nx.eccentricity(G).values()))
+
+    D = shortest_path_lengths(G)
+    if not np.isfinite(D).all():
+        raise nx.NetworkXError("Found infinite path length because the graph is not connected")
+
+    return D.max(axis=1)
+
+
+def average_shortest_path_length(G):
+    """Return the average shortest path length of G."""
+    if G.number_of_nodes() > MAX_DENSE_NODES:
         return nx.average_shortest_path_length(G)
-    elif metric == "radius":
-        return nx.radius(G)
-    elif metric == "diameter":
-        return nx.diameter(G)
-    elif metric == "node_connectivity":
-        return nx.node_connectivity(G)
-    elif metric == "edge_connectivity":
-        return nx.edge_connectivity(G)
-    elif metric == "avg_closeness_centrality":
-        return np.mean(list(nx.closeness_centrality(G).values()))
-    elif metric == "avg_betweenness_centrality":
-        return np.mean(list(nx.betweenness_centrality(G).values()))
-    elif metric == "avg_degree_centrality":
-        return np.mean(list(nx.degree_centrality(G).values()))
-    elif metric == "avg_pagerank":
-        return np.mean(list(nx.pagerank(G).values()))
-    elif metric == "avg_eigenvector_centrality":
-        return np.mean(list(nx.eigenvector_centrality(G).values()))
-    elif metric == "avg_clustering":
-        return nx.average_clustering(G)
-    elif metric == "degree_assortativity":
-        return nx.degree_assortativity_coefficient(G)
-    elif metric == "degree":
-        return nx.degree(G, u)
-    elif metric == "eccentricity":
-        return nx.eccentricity(G, u)
-    elif metric == "closeness_centrality":
-        return nx.closeness_centrality(G, u)
-    elif metric == "betweenness_centrality":
-        return nx.betweenness_centrality(G, u)
-    elif metric == "degree_centrality":
-        return nx.degree_centrality(G, u)
-    elif metric == "eigenvector_centrality":
-        return nx.eigenvector_centrality(G, u)
-    elif metric == "clustering":
-        return nx.clustering(G, u)
+
+    D = shortest_path_lengths(G)
+    if not np.isfinite(D).all():
+        raise nx.NetworkXError("Graph is not connected.")
+
+    n = G.number_of_nodes()
+    return D.sum() / (n * (n - 1)) if n > 1 else 0.0
+
+
+def closeness_centrality(G):
+    """
+    Compute the closeness centrality of the nodes of G from the cached 
+    shortest path lengths. As `nx.closeness_centrality`, the distances 
+    are inward for directed graphs and, in disconnected graphs, scaled 
+    by the fraction of reachable nodes (Wasserman and Faust).
+    """
+    if G.number_of_nodes() > MAX_DENSE_NODES:
+        return nx.closeness_centrality(G)
+
+    D = shortest_path_lengths(G)
+    if G.is_directed():
+        D = D.T
+
+    reachable = np.isfinite(D)
+    sizes = reachable.sum(axis=1) - 1
+    totals = np.where(reachable, D, 0).sum(axis=1)
+
+    values = np.zeros(len(D))
+    np.divide(sizes, totals, out=values, where=totals > 0)
+    if len(D) > 1:
+        values *= sizes / (len(D) - 1)
+    return dict(zip(G, values.tolist()))
+
+
+def _to_igraph(G):
+    """
+    Convert the undirected simple NetworkX graph G to an igraph graph whose 
+    i-th vertex is the i-th node of G. Self-loops are dropped since 
+    they change neither the shortest paths nor the triangles.
+    """
+    idx = {node: i for i, node in enumerate(G)}
+    edges = [(idx[u], idx[v]) for u, v in G.edges() if u != v]
+    return ig.Graph(n=len(idx), edges=edges)
+
+
+def igraph_betweenness_centrality(G):
+    """Same as `nx.betweenness_centrality(G)`, computed with igraph."""
+    if G.is_directed() or G.is_multigraph():
+        return nx.betweenness_centrality(G)
+
+    n = G.number_of_nodes()
+    scale = 2 / ((n - 1) * (n - 2)) if n > 2 else 1
+    values = _to_igraph(G).betweenness()
+    return {node: scale * value for node, value in zip(G, values)}
+
+
+def igraph_closeness_centrality(G):
+    """Same as `nx.closeness_centrality(G)`, computed with igraph."""
+    if G.is_directed() or G.is_multigraph():
+        return nx.closeness_centrality(G)
+
+    G_ig = _to_igraph(G)
+    n = G.number_of_nodes()
+
+    # igraph only considers the reachable nodes, while NetworkX also
+    # scales by the size of the component (Wasserman and Faust).
+    components = G_ig.connected_components()
+    sizes = components.sizes()
+    values = G_ig.closeness()
+
+    result = {}
+    for node, value, c in zip(G, values, components.membership):
+        if n > 1 and not np.isnan(value):
+            result[node] = value * (sizes[c] - 1) / (n - 1)
+        else:
+            result[node] = 0.0
+    return result
+
+
+def igraph_clustering(G):
+    """Same as `nx.clustering(G)`, computed with igraph."""
+    if G.is_directed() or G.is_multigraph():
+        return nx.clustering(G)
+
+    values = _to_igraph(G).transitivity_local_undirected(mode="zero")
+    return dict(zip(G, values))
+
+
+# Per-node metrics returning a {node: value} dictionary, cached per 
+# graph. Their `avg_*` global counterpart is the mean of the dictionary.
+NODE_METRICS = {
+    "degree": lambda G: dict(G.degree()),
+    "eccentricity": lambda G: dict(zip(G, eccentricities(G).astype(int).tolist())),
+    "closeness_centrality": closeness_centrality,
+    "betweenness_centrality": nx.betweenness_centrality,
+    "degree_centrality": nx.degree_centrality,
+    "pagerank": nx.pagerank,
+    "eigenvector_centrality": eigenvector_centrality,
+    "clustering": clustering,
+}
+
+# Use the C implementations of igraph when available.
+if ig is not None:
+    NODE_METRICS.update({
+        "closeness_centrality": igraph_closeness_centrality,
+        "betweenness_centrality": igraph_betweenness_centrality,
+        "clustering": igraph_clustering,
+    })
+
+
+def node_values(G, metric):
+    """
+    Return the {node: value} dictionary of `metric` for all the nodes 
+    of G. It is computed only once per graph, so that looping over the 
+    nodes does not recompute it for every node.
+    """
+    graph_cache = _cache.setdefault(G, {})
+    if metric not in graph_cache:
+        graph_cache[metric] = NODE_METRICS[metric](G)
+
+    return graph_cache[metric]
+
+
+def clear_cache(G=None):
+    """
+    Clear the cached metrics of G, or of all the graphs if G is None.
+    Must be called after modifying a graph.
+    """
+    if G is None:
+        _cache.clear()
     else:
-        raise NameError(f"{metric} is not a valid matric.")
\ No newline at end of file
+        _cache.pop(G, None)
+
+
+def average(values):
+    """
+    Return the average of the dictionary `values`, without building an 
+    intermediate list of its values.
+    """
+    return np.fromiter(values.values(), dtype=np.float64, count=len(values)).mean()
+
+
+# Functions computing each metric of a network G, or of its node u.
+_DISPATCH = {
+    "num_nodes": lambda G, u: G.number_of_nodes(),
+    "num_edges": lambda G, u: G.number_of_edges(),
+    "avg_degree": lambda G, u: average(dict(G.degree())),
+    "longest_shortest_path": lambda G, u: int(eccentricities(G).max()),
+    "avg_shortest_path": lambda G, u: average_shortest_path_length(G),
+    "radius": lambda G, u: int(eccentricities(G).min()),
+    "diameter": lambda G, u: int(eccentricities(G).max()),
+    "node_connectivity": lambda G, u: nx.node_connectivity(G),
+    "edge_connectivity": lambda G, u: nx.edge_connectivity(G),
+    "avg_closeness_centrality": lambda G, u: average(node_values(G, "closeness_centrality")),
+    "avg_betweenness_centrality": lambda G, u: average(node_values(G, "betweenness_centrality")),
+    "avg_degree_centrality": lambda G, u: average(node_values(G, "degree_centrality")),
+    "avg_pagerank": lambda G, u: average(node_values(G, "pagerank")),
+    "avg_eigenvector_centrality": lambda G, u: average(node_values(G, "eigenvector_centrality")),
+    "avg_clustering": lambda G, u: average(node_values(G, "clustering")),
+    "degree_assortativity": lambda G, u: nx.degree_assortativity_coefficient(G),
+    "degree": lambda G, u: nx.degree(G, u),
+    "eccentricity": lambda G, u: node_values(G, "eccentricity")[u],
+    "closeness_centrality": lambda G, u: node_values(G, "closeness_centrality")[u],
+    "betweenness_centrality": lambda G, u: node_values(G, "betweenness_centrality")[u],
+    "degree_centrality": lambda G, u: node_values(G, "degree_centrality")[u],
+    "eigenvector_centrality": lambda G, u: node_values(G, "eigenvector_centrality")[u],
+    "clustering": lambda G, u: node_values(G, "clustering")[u],
+}
+
+
+def compute_metric(G, metric, u=None):
+    try:
+        compute = _DISPATCH[metric]
+    except KeyError:
+        raise NameError(f"{metric} is not a valid matric.") from None
+
+    return compute(G, u)